@@ -1,140 +1,237 @@
 import streamlit as st
 import pandas as pd
+import polars as pl
+import os
 import zipfile
 import altair as alt
-import matplotlib.pyplot as plt
 import datetime
 from sklearn.linear_model import LinearRegression
 import numpy as np
 
+# Columns the app expects from the Parquet cache; a file written before a
+# schema change is regenerated instead of trusted
+CACHE_COLUMNS = {"InvoiceNo", "CustomerID", "InvoiceDate", "Country", "Description", "Quantity", "UnitPrice", "YearMonth", "Revenue"}
+
+
 # Extract & Load Data
 @st.cache_data
 def load_data():
-    with zipfile.ZipFile("data.zip", "r") as zip_ref:
-        zip_ref.extractall()  # Extracts data.csv
-
-    df = pd.read_csv("data.csv", encoding="ISO-8859-1")
-    df["InvoiceDate"] = pd.to_datetime(df["InvoiceDate"], errors="coerce")
-    df = df.dropna(subset=["CustomerID"])
-    df = df[(df["Quantity"] > 0) & (df["UnitPrice"] > 0)]
+    # Cleaned frame is cached as Parquet: typed columnar read, no CSV
+    # tokenizing or datetime re-parsing after the first cold start
+    if os.path.exists("data.parquet"):
+        cached = pd.read_parquet("data.parquet")
+        if CACHE_COLUMNS.issubset(cached.columns):
+            return cached
+
+    # Parse and clean with Polars (multi-threaded, Arrow-backed), reading the
+    # CSV entry straight out of the zip — no extracted data.csv on disk —
+    # then hand a pandas frame to the rest of the app at the display boundary
+    with zipfile.ZipFile("data.zip", "r") as zip_ref, zip_ref.open("data.csv") as csv_file:
+        df = (
+            pl.read_csv(
+                csv_file,
+                # Source CSV is ISO-8859-1; lossy decode replaces its few
+                # non-UTF8 bytes ("£" in rows that are dropped for null
+                # CustomerID), so nothing surviving the filter is mangled
+                encoding="utf8-lossy",
+                # Only the columns the dashboard uses (drops StockCode)
+                columns=["InvoiceNo", "CustomerID", "InvoiceDate", "Country", "Description", "Quantity", "UnitPrice"],
+                # Cancellation invoices ("C536379") make InvoiceNo a string;
+                # schema inference on the first rows would guess i64 and crash
+                schema_overrides={"InvoiceNo": pl.String},
+            )
+            .drop_nulls("CustomerID")
+            .filter((pl.col("Quantity") > 0) & (pl.col("UnitPrice") > 0))
+            .with_columns(pl.col("InvoiceDate").str.to_datetime("%m/%d/%Y %H:%M", strict=False))
+            .to_pandas()
+        )
     df["YearMonth"] = df["InvoiceDate"].dt.to_period("M")
+    # float32 revenue: half the footprint of float64, twice the SIMD lanes;
+    # cast after the multiply (int * float32 would promote to float64), and
+    # accept the sub-cent rounding on the KPI total that float32 implies
+    df["Revenue"] = (df["Quantity"] * df["UnitPrice"]).astype("float32")
+    # Low-cardinality keys as categoricals: integer-code groupby/isin, less RAM
+    for c in ("Country", "Description", "CustomerID"):
+        df[c] = df[c].astype("category")
+    df.to_parquet("data.parquet", compression="zstd")
     return df
 
+# Country-sorted copy for index-based filter slicing (binary search
+# instead of a full boolean scan per rerun)
+@st.cache_data
+def load_indexed():
+    return load_data().set_index("Country").sort_index()
+
+
+# Precompute filter-independent aggregates once (cached across reruns)
+@st.cache_data
+def load_aggregates():
+    df = load_data()
+    return {
+        "monthly_sales": df.groupby("YearMonth")["Quantity"].sum(),
+        "top_countries": df.groupby("Country", observed=True)["Quantity"].sum().nlargest(10),
+        "countries": df["Country"].unique(),
+        "products": df["Description"].unique(),
+    }
+
+# Materialized (Country, YearMonth, Description) -> Quantity view: a few MB
+# vs the raw frame, so per-filter product rankings touch far less memory
+@st.cache_data
+def load_cube():
+    df = load_data()
+    return df.groupby(["Country", "YearMonth", "Description"], observed=True)["Quantity"].sum().reset_index()
+
+
+# Serialize the download CSV once per unique filter result, not per rerun
+@st.cache_data
+def to_csv_bytes(frame):
+    return frame.to_csv(index=False).encode("utf-8")
+
+
+# Fit the sales-forecast model once; only predict() reruns on slider moves
+@st.cache_resource
+def get_forecast_model():
+    df = load_data()
+    df_sales = df.groupby(df["InvoiceDate"].dt.to_period("M"))["Quantity"].sum().reset_index()
+    # Period ordinal (months since epoch): contiguous ints, no string round-trip
+    df_sales["InvoiceDate"] = df_sales["InvoiceDate"].astype("int64")
+    model = LinearRegression()
+    model.fit(df_sales["InvoiceDate"].values.reshape(-1, 1), df_sales["Quantity"].values)
+    return model, df_sales
+
+
 df = load_data()
+df_idx = load_indexed()
+cube = load_cube()
+aggregates = load_aggregates()
 
 # Streamlit App Title
 st.title("📊 Customer Purchase Behavior Dashboard")
 st.write("🔹 **Explore customer purchase patterns, top-selling products, and trends.**")
 
-# Sidebar Filters
-st.sidebar.header("🔍 Filter Data")
+# Filter-dependent subtree: sidebar widgets live inside the fragment, so
+# changing a filter reruns only this section, not the global charts below
+@st.fragment
+def filtered_section():
+    # Sidebar Filters
+    st.sidebar.header("🔍 Filter Data")
 
-# Multi-select for Country
-selected_countries = st.sidebar.multiselect(
-    "Select Country", df["Country"].unique(), default=["United Kingdom"]
-)
+    # Multi-select for Country
+    selected_countries = st.sidebar.multiselect(
+        "Select Country", aggregates["countries"], default=["United Kingdom"]
+    )
 
-# Multi-select for Product
-selected_products = st.sidebar.multiselect(
-    "Select Product", df["Description"].unique(), default=df["Description"].unique()[:5]
-)
+    # Multi-select for Product
+    selected_products = st.sidebar.multiselect(
+        "Select Product", aggregates["products"], default=aggregates["products"][:5]
+    )
 
-# Date Range Picker
-start_date, end_date = st.sidebar.date_input(
-    "Select Date Range",
-    [df["InvoiceDate"].min(), df["InvoiceDate"].max()],
-    df["InvoiceDate"].min(),
-    df["InvoiceDate"].max(),
-)
+    # Date Range Picker
+    start_date, end_date = st.sidebar.date_input(
+        "Select Date Range",
+        [df["InvoiceDate"].min(), df["InvoiceDate"].max()],
+        df["InvoiceDate"].min(),
+        df["InvoiceDate"].max(),
+    )
 
-# Apply Filters
-filtered_df = df[
-    (df["Country"].isin(selected_countries)) &
-    (df["Description"].isin(selected_products)) &
-    (df["InvoiceDate"] >= pd.to_datetime(start_date)) &
-    (df["InvoiceDate"] <= pd.to_datetime(end_date))
-]
-
-st.write(f"✅ Showing data for {len(filtered_df)} transactions from {start_date} to {end_date}")
-
-# KPI Metrics
-st.subheader("📊 Key Performance Indicators (KPIs)")
-total_revenue = (filtered_df["Quantity"] * filtered_df["UnitPrice"]).sum()
-total_sales = filtered_df["Quantity"].sum()
-total_customers = filtered_df["CustomerID"].nunique()
-col1, col2, col3 = st.columns(3)
-col1.metric("💰 Total Revenue", f"${total_revenue:,.2f}")
-col2.metric("📦 Total Sales", f"{total_sales:,}")
-col3.metric("👥 Unique Customers", f"{total_customers}")
-
-# 💰 Fix Revenue Breakdown by Country & Product
-st.subheader("💰 Revenue Breakdown by Country & Product")
-
-# Calculate Total Revenue (Quantity * UnitPrice)
-revenue_by_country = (
-    filtered_df.groupby("Country").apply(lambda x: (x["Quantity"] * x["UnitPrice"]).sum())
-    .reset_index()
-    .rename(columns={0: "Total Revenue"})
-    .sort_values(by="Total Revenue", ascending=False)
-)
+    # Apply Filters: index lookup for countries, then one query() over the
+    # slice — numexpr handles the date comparisons; the `in` membership test
+    # goes through pandas' python parser
+    start_ts = np.datetime64(start_date)
+    end_ts = np.datetime64(end_date)
+    country_slice = df_idx.loc[selected_countries]
+    filtered_df = country_slice.query(
+        "Description in @selected_products and @start_ts <= InvoiceDate <= @end_ts"
+    ).reset_index()
+
+    st.write(f"✅ Showing data for {len(filtered_df)} transactions from {start_date} to {end_date}")
+
+    # KPI Metrics
+    st.subheader("📊 Key Performance Indicators (KPIs)")
+    total_revenue = filtered_df["Revenue"].sum()
+    total_sales = filtered_df["Quantity"].sum()
+    total_customers = filtered_df["CustomerID"].nunique()
+    col1, col2, col3 = st.columns(3)
+    col1.metric("💰 Total Revenue", f"${total_revenue:,.2f}")
+    col2.metric("📦 Total Sales", f"{total_sales:,}")
+    col3.metric("👥 Unique Customers", f"{total_customers}")
+
+    # 💰 Fix Revenue Breakdown by Country & Product
+    st.subheader("💰 Revenue Breakdown by Country & Product")
+
+    # Total Revenue per country from the precomputed Revenue column (vectorized)
+    revenue_by_country = (
+        filtered_df.groupby("Country", sort=False, observed=True)["Revenue"].sum()
+        .sort_values(ascending=False)
+        .reset_index(name="Total Revenue")
+    )
 
-# Debugging Step: Show Data Table to Verify Revenue Calculation
-st.write("🔍 **Debugging: Revenue Data Check**")
-st.dataframe(revenue_by_country)
+    # Debugging Step: Show Data Table to Verify Revenue Calculation
+    st.write("🔍 **Debugging: Revenue Data Check**")
+    st.dataframe(revenue_by_country)
+
+    # Fix Chart to Show Revenue for Multiple Countries (rendered in-browser)
+    st.bar_chart(revenue_by_country, x="Country", y="Total Revenue")
+
+    # Top Selling Products (Interactive Bar Chart)
+    # Ranked from the materialized cube (month granularity) instead of the raw frame
+    st.subheader("🏆 Top 10 Best-Selling Products")
+    top_products = (
+        cube[
+            cube["Country"].isin(selected_countries)
+            & cube["Description"].isin(selected_products)
+            & cube["YearMonth"].between(pd.Period(start_date, "M"), pd.Period(end_date, "M"))
+        ]
+        .groupby("Description", observed=True)["Quantity"].sum()
+        .nlargest(10)
+    )
+    chart = (
+        alt.Chart(top_products.reset_index())
+        .mark_bar()
+        .encode(
+            x=alt.X("Quantity:Q", title="Total Quantity Sold"),
+            y=alt.Y("Description:N", title="Product", sort="-x"),
+            tooltip=["Description", "Quantity"],
+        )
+        .interactive()
+    )
+    st.altair_chart(chart, use_container_width=True)
 
-# Fix Chart to Show Revenue for Multiple Countries
-fig, ax = plt.subplots(figsize=(8, 5))
-ax.bar(revenue_by_country["Country"], revenue_by_country["Total Revenue"], color="lightblue")
-ax.set_title("Total Revenue by Country")
-ax.set_ylabel("Revenue ($)")
-ax.set_xlabel("Country")
-ax.set_xticklabels(revenue_by_country["Country"], rotation=45)
+    # Download Data
+    st.subheader("📥 Download Filtered Data")
+    csv = to_csv_bytes(filtered_df)
+    st.download_button(label="Download CSV", data=csv, file_name="filtered_data.csv", mime="text/csv")
 
-st.pyplot(fig)
 
+filtered_section()
 
 # Profit Margin Analysis
 st.subheader("💰 Profit Margin Analysis")
 df["CostPrice"] = df["UnitPrice"] * 0.6  # Assume cost is 60% of selling price
 df["ProfitMargin"] = df["UnitPrice"] - df["CostPrice"]
-profit_by_product = df.groupby("Description")["ProfitMargin"].mean().sort_values(ascending=False).head(10)
+profit_by_product = df.groupby("Description", observed=True)["ProfitMargin"].mean().nlargest(10)
 st.bar_chart(profit_by_product)
 
 # Customer Segmentation (RFM Analysis)
 st.subheader("👥 Customer Segmentation (RFM Analysis)")
-rfm = df.groupby("CustomerID").agg({
-    "InvoiceDate": lambda x: (df["InvoiceDate"].max() - x.max()).days,  # Recency
-    "InvoiceNo": "count",  # Frequency
-    "UnitPrice": "sum"  # Monetary Value
-}).rename(columns={"InvoiceDate": "Recency", "InvoiceNo": "Frequency", "UnitPrice": "Monetary"})
-st.write(rfm.sort_values(by="Monetary", ascending=False).head(10))
-
-# Top Selling Products (Interactive Bar Chart)
-st.subheader("🏆 Top 10 Best-Selling Products")
-top_products = filtered_df.groupby("Description")["Quantity"].sum().sort_values(ascending=False).head(10)
-chart = (
-    alt.Chart(top_products.reset_index())
-    .mark_bar()
-    .encode(
-        x=alt.X("Quantity:Q", title="Total Quantity Sold"),
-        y=alt.Y("Description:N", title="Product", sort="-x"),
-        tooltip=["Description", "Quantity"],
-    )
-    .interactive()
+max_dt = df["InvoiceDate"].max()
+rfm = df.groupby("CustomerID", observed=True).agg(
+    LastPurchase=("InvoiceDate", "max"),
+    Frequency=("InvoiceNo", "count"),  # Frequency
+    Monetary=("UnitPrice", "sum"),  # Monetary Value
 )
-st.altair_chart(chart, use_container_width=True)
+rfm["Recency"] = (max_dt - rfm["LastPurchase"]).dt.days  # Recency
+rfm = rfm[["Recency", "Frequency", "Monetary"]]
+st.write(rfm.nlargest(10, "Monetary"))
 
 # Monthly Sales Trend (Interactive Line Chart)
 st.subheader("📈 Monthly Sales Trend")
-monthly_sales = df.groupby("YearMonth")["Quantity"].sum()
-fig, ax = plt.subplots()
-monthly_sales.plot(marker="o", ax=ax, color="darkorange")
-ax.set_ylabel("Total Quantity Sold")
-st.pyplot(fig)
+monthly_sales = aggregates["monthly_sales"]
+st.line_chart(monthly_sales.to_timestamp())
 
 # Top Countries by Sales
 st.subheader("🌍 Top 10 Countries by Sales")
-top_countries = df.groupby("Country")["Quantity"].sum().sort_values(ascending=False).head(10)
+top_countries = aggregates["top_countries"]
 st.table(top_countries)
 
 # Sales Forecasting - Long-Term Prediction
@@ -143,41 +240,22 @@ st.subheader("📊 Predict Future Sales")
 # User Input: Select Forecast Length
 n_months = st.slider("Select months to predict:", min_value=6, max_value=36, value=12, step=3)
 
-# Prepare Data for Forecasting
-df_sales = df.groupby(df["InvoiceDate"].dt.to_period("M"))["Quantity"].sum().reset_index()
-df_sales["InvoiceDate"] = df_sales["InvoiceDate"].astype(str).str.replace("-", "").astype(int)
-
-# Train Model
-X = df_sales["InvoiceDate"].values.reshape(-1, 1)
-y = df_sales["Quantity"].values
-model = LinearRegression()
-model.fit(X, y)
+# Cached model fit; only the prediction depends on the slider
+model, df_sales = get_forecast_model()
 
 # Predict Future Months
 future_months = np.array([df_sales["InvoiceDate"].max() + i for i in range(1, n_months + 1)]).reshape(-1, 1)
 predicted_sales = model.predict(future_months)
 
-# Combine Past Data & Predictions
-forecast_df = pd.DataFrame({"InvoiceDate": df_sales["InvoiceDate"], "Sales": df_sales["Quantity"]})
-forecast_future = pd.DataFrame({"InvoiceDate": future_months.flatten(), "Sales": predicted_sales})
-
-# Plot Both Historical & Predicted Data
-fig, ax = plt.subplots(figsize=(10, 5))
-ax.plot(forecast_df["InvoiceDate"], forecast_df["Sales"], marker="o", label="Actual Sales", color="blue")
-ax.plot(forecast_future["InvoiceDate"], forecast_future["Sales"], marker="o", linestyle="dashed", label="Predicted Sales", color="red")
-
-ax.set_title(f"Sales Forecast (Next {n_months} Months)")
-ax.set_xlabel("YearMonth")
-ax.set_ylabel("Total Sales")
-ax.legend()
-ax.grid(True)
-
-st.pyplot(fig)
-
+# Combine Past Data & Predictions; the ordinals feed the regression only,
+# so map them back to calendar months for the chart axis
+forecast_df = pd.DataFrame({"InvoiceDate": df_sales["InvoiceDate"], "Actual Sales": df_sales["Quantity"]})
+forecast_future = pd.DataFrame({"InvoiceDate": future_months.flatten(), "Predicted Sales": predicted_sales})
+forecast_chart = pd.concat([forecast_df, forecast_future])
+forecast_chart.index = pd.PeriodIndex.from_ordinals(forecast_chart["InvoiceDate"], freq="M").to_timestamp()
 
-# Download Data
-st.subheader("📥 Download Filtered Data")
-csv = filtered_df.to_csv(index=False).encode("utf-8")
-st.download_button(label="Download CSV", data=csv, file_name="filtered_data.csv", mime="text/csv")
+# Plot Both Historical & Predicted Data (rendered in-browser)
+st.write(f"**Sales Forecast (Next {n_months} Months)**")
+st.line_chart(forecast_chart[["Actual Sales", "Predicted Sales"]])
 
 st.write("📌 **Insights:** This dashboard provides an interactive way to analyze purchase trends, identify top products, track revenue, and predict future sales.")